@@ -1,19 +1,89 @@
 import os
+import atexit
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import secrets
+import signal
+import time
 import logging
+import logging.handlers
+import queue
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+import orjson
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import AIORateLimiter, Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.request import HTTPXRequest
 import google.generativeai as genai
-from flask import Flask
-from threading import Thread
+from google.api_core.exceptions import DeadlineExceeded, ResourceExhausted, ServiceUnavailable
+from aiohttp import web
 from md2tgmd import escape as convert
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
 
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
 MAX_USER_MESSAGE_CHARS = 3000
 MAX_TELEGRAM_MESSAGE_CHARS = 4000
+RESPONSE_CACHE_SIZE = 256
+TELEGRAM_MAX_RATE = 28
+TELEGRAM_MAX_RETRIES = 3
+POLLING_TIMEOUT = 50
+# Telegram allows about 20 messages a minute per group; edits count too, so group replies are edited less often.
+TELEGRAM_GROUP_MAX_RATE = 20
+STREAM_EDIT_INTERVAL = 1.0
+GROUP_STREAM_EDIT_INTERVAL = 60 / TELEGRAM_GROUP_MAX_RATE
+STREAM_PLACEHOLDER = "…"
+CONVERT_IN_THREAD_CHARS = 512
+GEMINI_MAX_ATTEMPTS = 4
+# Overload and timeout errors that usually succeed when retried after a short wait.
+TRANSIENT_GEMINI_ERRORS = (ResourceExhausted, ServiceUnavailable, DeadlineExceeded)
+# Only the update kinds the handlers answer; everything else is filtered out by Telegram.
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHANNEL_POST]
+# Opening greetings and acknowledgements carry nothing to ask Gemini; they get a canned reply instead.
+GREETINGS = frozenset({
+    "hi", "hello", "hey", "hiya", "yo", "sup", "good morning", "good afternoon", "good evening",
+    "thanks", "thank you", "thx", "ty", "cheers", "ok", "okay", "k", "kk", "cool", "nice", "great",
+    "got it", "bye", "goodbye", "see you", "good night",
+})
+MAX_CHAT_SESSIONS = int(os.environ.get("MAX_CHAT_SESSIONS", 5000))
+CHAT_SESSION_TTL = int(os.environ.get("CHAT_SESSION_TTL", 3600))
+MAX_HISTORY_TURNS = int(os.environ.get("MAX_HISTORY_TURNS", 20))
+GEMINI_MAX_INFLIGHT = int(os.environ.get("GEMINI_MAX_INFLIGHT", 16))
+# Messages from one sender arriving within this many seconds of each other are sent to Gemini together.
+DEBOUNCE_SECONDS = float(os.environ.get("DEBOUNCE_SECONDS", 0.75))
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH")
+# Public base URL of this service; when set, Telegram pushes updates to it instead of being polled.
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+# Random per process, so only Telegram (told via set_webhook) knows where and how to post updates.
+WEBHOOK_PATH = f"/telegram/{secrets.token_urlsafe(24)}"
+WEBHOOK_SECRET_TOKEN = secrets.token_urlsafe(32)
 
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+# Fixed replies are converted to MarkdownV2 once instead of on every error.
+START_CHAT_ERROR_MD = convert("Error starting Gemini chat.")
+GEMINI_ERROR_MD = convert("Error communicating with Gemini.")
+GREETING_REPLY_MD = convert("👋 Send me a question whenever you're ready.")
+WELCOME_TEMPLATE = "Hi {mention}! I'm {username}, a bot powered by Google Gemini. How can I help you today?"
+
+# Handlers only enqueue records; a listener thread formats them and writes to stderr off the event loop.
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+logging.getLogger().setLevel(logging.INFO)
+# The format string never uses thread or process fields, so don't collect them for every record.
+logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 if GEMINI_API_KEY:
@@ -22,92 +92,411 @@ if GEMINI_API_KEY:
 else:
     gemini_model = None
 
-user_gemini_chats = {}
+# Optional SQLite store so conversations survive restarts and LRU eviction.
+if SESSION_DB_PATH:
+    session_db = sqlite3.connect(SESSION_DB_PATH, check_same_thread=False, isolation_level=None)
+    session_db.execute("PRAGMA journal_mode=WAL")
+    session_db.execute("CREATE TABLE IF NOT EXISTS user_sessions (chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, history BLOB NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (chat_id, user_id))")
+    session_db.execute("DELETE FROM user_sessions WHERE updated_at < ?", (time.time() - CHAT_SESSION_TTL,))
+else:
+    session_db = None
+session_db_lock = threading.Lock()
+
+class LRUCache(OrderedDict):
+    """Dict that keeps at most `maxsize` entries, evicting the least recently used.
+
+    When `ttl` is set, entries left untouched for `ttl` seconds are dropped as well.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._last_used = {}
+
+    def _touch(self, key):
+        self.move_to_end(key)
+        if self.ttl is not None: self._last_used[key] = time.monotonic()
+
+    def _expire(self):
+        # Entries are kept in recency order, so expired ones are always at the front.
+        if self.ttl is None: return
+        deadline = time.monotonic() - self.ttl
+        while self:
+            oldest = next(iter(self))
+            if self._last_used[oldest] > deadline: break
+            del self[oldest]
+
+    def __getitem__(self, key):
+        self._expire()
+        value = super().__getitem__(key)
+        self._touch(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._expire()
+        super().__setitem__(key, value)
+        self._touch(key)
+        if len(self) > self.maxsize: del self[next(iter(self))]
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._last_used.pop(key, None)
+
+    def __contains__(self, key):
+        self._expire()
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+user_gemini_chats = LRUCache(MAX_CHAT_SESSIONS, ttl=CHAT_SESSION_TTL)
+user_chat_locks = LRUCache(MAX_CHAT_SESSIONS, ttl=CHAT_SESSION_TTL)
+response_cache = LRUCache(RESPONSE_CACHE_SIZE)
+# Time of the last streaming edit per chat, shared by every reply streaming into that chat.
+last_stream_edit = LRUCache(MAX_CHAT_SESSIONS)
+# Excess requests wait here rather than all hitting Gemini at once and failing on quota.
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_INFLIGHT)
+# Messages waiting out DEBOUNCE_SECONDS, per session; only ever holds the current burst.
+pending_fragments = {}
+
+class OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest that decodes Bot API responses with orjson instead of the stdlib json module."""
+
+    @staticmethod
+    def parse_json_payload(payload):
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # Let PTB's decoder handle invalid UTF-8 and raise its usual TelegramError.
+            return HTTPXRequest.parse_json_payload(payload)
 
-flask_app = Flask(__name__)
+APPLICATION_KEY = web.AppKey("application", Application)
 
-@flask_app.route('/ping')
-def ping():
-    return "PONG - Bot is alive!", 200
+async def ping(request):
+    return web.Response(text="PONG - Bot is alive!")
 
-def run_flask_server():
-    flask_app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
+async def telegram_webhook(request):
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET_TOKEN):
+        raise web.HTTPForbidden()
+    application = request.app[APPLICATION_KEY]
+    update = Update.de_json(await request.json(loads=orjson.loads), application.bot)
+    await application.update_queue.put(update)
+    return web.Response()
 
 def split_message(text, max_length):
+    # Walk start/end offsets over the original string so each chunk is sliced exactly once.
     chunks = []
-    remaining_text = text
-    while len(remaining_text) > max_length:
-        split_point = remaining_text.rfind('\n', 0, max_length)
-        if split_point == -1: split_point = remaining_text.rfind(' ', 0, max_length)
-        if split_point == -1: split_point = max_length
-        chunks.append(remaining_text[:split_point].strip())
-        remaining_text = remaining_text[split_point:].strip()
-    if remaining_text: chunks.append(remaining_text)
+    start, end = 0, len(text)
+    while end > start and text[end - 1].isspace(): end -= 1
+    while start < end and text[start].isspace(): start += 1
+    while end - start > max_length:
+        window_end = start + max_length
+        split_point = text.rfind('\n', start, window_end)
+        if split_point <= start: split_point = text.rfind(' ', start, window_end)
+        if split_point <= start: split_point = window_end
+        chunks.append(text[start:split_point].strip())
+        start = split_point
+        while start < end and text[start].isspace(): start += 1
+    if start < end: chunks.append(text[start:end])
     return chunks
 
+def load_history(session_key):
+    with session_db_lock:
+        row = session_db.execute(
+            "SELECT history FROM user_sessions WHERE chat_id = ? AND user_id = ? AND updated_at >= ?", (*session_key, time.time() - CHAT_SESSION_TTL)
+        ).fetchone()
+    return orjson.loads(row[0]) if row else []
+
+def save_history(session_key, history):
+    data = orjson.dumps([{"role": content.role, "parts": [part.text for part in content.parts]} for content in history])
+    with session_db_lock:
+        session_db.execute(
+            "INSERT INTO user_sessions (chat_id, user_id, history, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id, user_id) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at",
+            (*session_key, data, time.time()),
+        )
+
+def response_cache_key(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+async def to_markdown(text):
+    # Converting a long reply can take tens of milliseconds; do it off the event loop so other chats keep moving.
+    if len(text) < CONVERT_IN_THREAD_CHARS:
+        return convert(text)
+    return await asyncio.to_thread(convert, text)
+
+async def send_markdown(bot, chat_id, text):
+    await bot.send_message(chat_id=chat_id, text=await to_markdown(text), parse_mode="MarkdownV2")
+
+async def edit_markdown(message, text):
+    return await message.edit_text(await to_markdown(text), parse_mode="MarkdownV2")
+
+async def stream_reply(bot, message, response):
+    """Stream a Gemini response into `message`, editing it in place as text arrives.
+
+    `response` is awaited first, so a request that fails before streaming is handled like one that
+    fails part-way. Edits are throttled to one per STREAM_EDIT_INTERVAL seconds per chat, or
+    GROUP_STREAM_EDIT_INTERVAL in groups and channels, across all replies streaming into it. When
+    the text outgrows one Telegram message, that part is finalised and the reply continues in a new
+    message.
+    On failure the message in progress is turned into the error reply before re-raising.
+    Returns the whole reply.
+    """
+    chat_id = message.chat_id
+    # Negative ids are groups and channels, which share the rate limiter's per-group budget.
+    edit_interval = STREAM_EDIT_INTERVAL if chat_id > 0 else GROUP_STREAM_EDIT_INTERVAL
+    pieces = []
+    buffer = ""
+    part = 0
+    shown = ""
+    last_stream_edit[chat_id] = time.monotonic()
+
+    def labelled(text):
+        return f"(Part {part + 1})\n\n{text}" if part else text
+
+    try:
+        async for chunk in await response:
+            pieces.append(chunk.text)
+            buffer += chunk.text
+            chunks = split_message(buffer, MAX_TELEGRAM_MESSAGE_CHARS) if len(buffer) > MAX_TELEGRAM_MESSAGE_CHARS else None
+            if chunks and len(chunks) > 1:
+                # Keep the unfinished tail, including trailing whitespace, so the next piece joins it correctly.
+                buffer = buffer[buffer.rfind(chunks[-1]):]
+                for ready in chunks[:-1]:
+                    part += 1
+                    finished = f"(Part {part})\n\n{ready}"
+                    if finished != shown:
+                        await edit_markdown(message, finished)
+                    # A finished part must survive a failure below; only a message still in progress is replaced.
+                    message = None
+                    message = await bot.send_message(chat_id=chat_id, text=STREAM_PLACEHOLDER)
+                    shown = ""
+                last_stream_edit[chat_id] = time.monotonic()
+            elif time.monotonic() - last_stream_edit.get(chat_id, 0.0) >= edit_interval:
+                text = labelled(buffer.strip())
+                if buffer.strip() and text != shown:
+                    try:
+                        await edit_markdown(message, text)
+                    except BadRequest:
+                        pass  # Half-streamed Markdown is not always valid yet; the next edit will retry.
+                    else:
+                        shown = text
+                    last_stream_edit[chat_id] = time.monotonic()
+
+        text = buffer.strip()
+        if not text:
+            await message.delete()
+        elif labelled(text) != shown:
+            await edit_markdown(message, labelled(text))
+    except Exception:
+        if message:
+            with contextlib.suppress(TelegramError):
+                await message.edit_text(GEMINI_ERROR_MD, parse_mode="MarkdownV2")
+        raise
+    return "".join(pieces)
+
+async def start_reply_stream(chat, text):
+    # A failed attempt leaves the chat history untouched, so it is safe to send again.
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            return await chat.send_message_async(text, stream=True)
+        except TRANSIENT_GEMINI_ERRORS:
+            if attempt == GEMINI_MAX_ATTEMPTS - 1: raise
+            await asyncio.sleep(min(2 ** attempt, 30) * (1 + random.random()))
+
+async def send_too_long(bot, chat_id, length):
+    warning = f"The message is too long ({length} chars). Max {MAX_USER_MESSAGE_CHARS} chars."
+    await bot.send_message(chat_id=chat_id, text=convert(warning), parse_mode="MarkdownV2")
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     bot_username = context.bot.username
-    welcome_message = f"Hi {user.mention_html() if user else 'there'}! I'm {bot_username}, a bot powered by Google Gemini."
-    await update.message.reply_html(welcome_message + " How can I help you today?")
+    await update.message.reply_html(WELCOME_TEMPLATE.format(mention=user.mention_html() if user else "there", username=bot_username))
+
+async def get_or_create_chat(session_key):
+    # Callers hold the session's lock, so two updates for one session can't both start it.
+    chat = user_gemini_chats.get(session_key)
+    if chat is None:
+        history = await asyncio.to_thread(load_history, session_key) if session_db else []
+        chat = user_gemini_chats[session_key] = gemini_model.start_chat(history=history)
+    return chat
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.effective_message
     if not gemini_model:
-        await update.message.reply_text("Gemini AI not configured.")
+        if message: await message.reply_text("Gemini AI not configured.")
         return
 
-    message = update.effective_message
-    if not message or not message.text:
+    text = message.text if message else None
+    if not text:
         return
 
-    chat_id = message.chat.id
-    user_message_text = message.text.strip()
+    bot = context.bot
+    chat_id = message.chat_id
+    message_length = len(text)
+    # Far over the limit: reject without strip() copying the whole message first.
+    if message_length <= MAX_USER_MESSAGE_CHARS + 64:
+        user_message_text = text.strip()
+        if not user_message_text:
+            return
+        message_length = len(user_message_text)
 
-    if not user_message_text:
+    if message_length > MAX_USER_MESSAGE_CHARS:
+        await send_too_long(bot, chat_id, message_length)
         return
 
-    if len(user_message_text) > MAX_USER_MESSAGE_CHARS:
-        warning = f"The message is too long ({len(user_message_text)} chars). Max {MAX_USER_MESSAGE_CHARS} chars."
-        await context.bot.send_message(chat_id=chat_id, text=convert(warning), parse_mode="MarkdownV2")
-        return
+    # Group members each get their own conversation; channel posts have no sender and share user 0.
+    session_key = (chat_id, message.from_user.id if message.from_user else 0)
+    if DEBOUNCE_SECONDS:
+        fragments = pending_fragments.setdefault(session_key, [])
+        fragments.append(user_message_text)
+        count = len(fragments)
+        await asyncio.sleep(DEBOUNCE_SECONDS)
+        # A later message arrived in the meantime; its handler sends the whole burst.
+        if len(fragments) != count: return
+        del pending_fragments[session_key]
+        user_message_text = "\n".join(fragments)
+        # Each fragment fit on its own, but the burst as a whole must too.
+        if len(user_message_text) > MAX_USER_MESSAGE_CHARS:
+            await send_too_long(bot, chat_id, len(user_message_text))
+            return
 
-    if chat_id not in user_gemini_chats:
+    async with user_chat_locks.setdefault(session_key, asyncio.Lock()):
         try:
-            user_gemini_chats[chat_id] = gemini_model.start_chat(history=[])
+            chat = await get_or_create_chat(session_key)
         except Exception:
-            await context.bot.send_message(chat_id=chat_id, text=convert("Error starting Gemini chat."), parse_mode="MarkdownV2")
+            await bot.send_message(chat_id=chat_id, text=START_CHAT_ERROR_MD, parse_mode="MarkdownV2")
             return
 
-    try:
-        response = user_gemini_chats[chat_id].send_message(user_message_text)
-        gemini_response = response.text
-        chunks = split_message(gemini_response, MAX_TELEGRAM_MESSAGE_CHARS)
-        for i, part in enumerate(chunks):
-            header = f"(Part {i+1}/{len(chunks)})\n\n" if len(chunks) > 1 else ""
-            await context.bot.send_message(chat_id=chat_id, text=convert(header + part), parse_mode="MarkdownV2")
-    except Exception:
-        await context.bot.send_message(chat_id=chat_id, text=convert("Error communicating with Gemini."), parse_mode="MarkdownV2")
+        history = placeholder = None
+        try:
+            history = chat.history
+            # The whole history is resent every turn, so only keep the most recent user/model exchanges
+            # (none at all when MAX_HISTORY_TURNS is 0).
+            del history[:max(len(history) - 2 * MAX_HISTORY_TURNS, 0)]
+            # Mid-conversation, "ok" or "got it" may be answering the model, so only an opening greeting is skipped.
+            if not history and user_message_text.lower().rstrip("!.? ") in GREETINGS:
+                await bot.send_message(chat_id=chat_id, text=GREETING_REPLY_MD, parse_mode="MarkdownV2")
+                return
+            # Only opening messages are cached: later replies depend on the conversation so far.
+            cache_key = None if history else response_cache_key(user_message_text)
+            gemini_response = response_cache.get(cache_key) if cache_key else None
+            if gemini_response is not None:
+                chat.history = [{"role": "user", "parts": [user_message_text]}, {"role": "model", "parts": [gemini_response]}]
+                if len(gemini_response) <= MAX_TELEGRAM_MESSAGE_CHARS:
+                    await send_markdown(bot, chat_id, gemini_response)
+                else:
+                    chunks = split_message(gemini_response, MAX_TELEGRAM_MESSAGE_CHARS)
+                    total = len(chunks)
+                    # Parts are labelled, so they can be sent concurrently instead of one round-trip at a time.
+                    await asyncio.gather(*(send_markdown(bot, chat_id, f"(Part {i+1}/{total})\n\n{part}") for i, part in enumerate(chunks)))
+            else:
+                # Acknowledge straight away, even while waiting for a free Gemini slot.
+                placeholder = await bot.send_message(chat_id=chat_id, text=STREAM_PLACEHOLDER)
+                async with gemini_semaphore:
+                    gemini_response = await stream_reply(bot, placeholder, start_reply_stream(chat, user_message_text))
+                # Cache the reply as sent: stripped, and never empty, since Telegram rejects empty messages.
+                gemini_response = gemini_response.strip()
+                if cache_key and gemini_response: response_cache[cache_key] = gemini_response
+        except Exception:
+            logger.exception("Gemini reply failed for session %s", session_key)
+            # A stream that dies part-way leaves ChatSession.history raising on every read; reset it to the
+            # turns from before this message, or drop the session if even those couldn't be read.
+            if history is None: del user_gemini_chats[session_key]
+            else: chat.history = history
+            # Once the placeholder exists, stream_reply has already turned it into the error.
+            if placeholder is None:
+                await bot.send_message(chat_id=chat_id, text=GEMINI_ERROR_MD, parse_mode="MarkdownV2")
+            return
+
+        if session_db:
+            try:
+                await asyncio.to_thread(save_history, session_key, chat.history)
+            except Exception:
+                logger.exception("Could not save history for session %s", session_key)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update and update.effective_chat and update.effective_chat.type == "private":
-        if update.effective_message:
-            await update.effective_message.reply_text("Bot error. Please try again later.")
+    chat = update.effective_chat if update else None
+    if chat and chat.type == "private":
+        message = update.effective_message
+        if message:
+            await message.reply_text("Bot error. Please try again later.")
+
+async def run_bot(application):
+    # Serve /ping (and the webhook, if enabled) from the bot's own event loop instead of a separate server thread.
+    web_app = web.Application()
+    web_app[APPLICATION_KEY] = application
+    web_app.router.add_get('/ping', ping)
+    if WEBHOOK_URL:
+        web_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, host='0.0.0.0', port=int(os.environ.get('PORT', 8080))).start()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    except NotImplementedError:
+        pass  # Windows: Ctrl+C cancels run_bot instead, and the finally blocks below still shut down cleanly.
+
+    try:
+        async with application:
+            await application.start()
+            if WEBHOOK_URL:
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL + WEBHOOK_PATH, allowed_updates=ALLOWED_UPDATES, secret_token=WEBHOOK_SECRET_TOKEN
+                )
+            else:
+                # Hold each getUpdates open for up to POLLING_TIMEOUT seconds so an idle bot barely polls.
+                await application.updater.start_polling(
+                    allowed_updates=ALLOWED_UPDATES, poll_interval=0.0, timeout=POLLING_TIMEOUT, bootstrap_retries=-1
+                )
+            try:
+                await stop_event.wait()
+            finally:
+                if application.updater.running:
+                    await application.updater.stop()
+                await application.stop()
+    finally:
+        await runner.cleanup()
 
 def main():
     if not BOT_TOKEN:
         logger.critical("TELEGRAM_BOT_TOKEN not set.")
         return
 
-    flask_thread = Thread(target=run_flask_server, daemon=True)
-    flask_thread.start()
-
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Shape outbound traffic below Telegram's flood limits instead of running into 429 retries.
+    rate_limiter = AIORateLimiter(
+        overall_max_rate=TELEGRAM_MAX_RATE, overall_time_period=1,
+        group_max_rate=TELEGRAM_GROUP_MAX_RATE, group_time_period=60,
+        max_retries=TELEGRAM_MAX_RETRIES,
+    )
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(OrjsonRequest(connection_pool_size=256, http_version="2"))
+        .get_updates_request(OrjsonRequest(http_version="2"))
+        .concurrent_updates(True)
+        .rate_limiter(rate_limiter)
+        .build()
+    )
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(CommandHandler("start", start, block=False))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message, block=False))
     application.add_error_handler(error_handler)
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if uvloop: asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    try:
+        asyncio.run(run_bot(application))
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     main()